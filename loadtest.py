@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+# Copyright (c) The Kowabunga Project
+# Apache License, Version 2.0 (see LICENSE or https://www.apache.org/licenses/LICENSE-2.0.txt)
+# SPDX-License-Identifier: Apache-2.0
+
+import argparse
+import math
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from nfsapi.common import *
+from nfsapi.api import NfsExport, RestServer
+from nfsapi.exports import GaneshaExportConfig
+
+HOST = '127.0.0.1'
+PORT = 54935
+
+OP_LIST = 'GET /api/v1/export'
+OP_CREATE = 'POST /api/v1/export'
+OP_READ = 'GET /api/v1/export/<eid>'
+OP_UPDATE = 'PUT /api/v1/export/<eid>'
+OP_DELETE = 'DELETE /api/v1/export/<eid>'
+OPS = [OP_LIST, OP_CREATE, OP_READ, OP_UPDATE, OP_DELETE]
+
+ACCESS = NFS_EXPORT_ATTR_ACCESS_TYPE_ALLOWED_VALUES
+PROTOCOLS = [[3], [4], [3, 4]]
+CLIENTS = [['10.0.0.0/8'], ['192.168.0.0/24'], ['172.16.0.0/12', '10.69.0.0/16']]
+
+def as_list(v):
+    # the configuration parser turns single-item lists back into scalars
+    return v if type(v) == list else [v]
+
+def state(export):
+    return (export.name, export.fs, export.path, export.access,
+            as_list(export.protocols), as_list(export.clients))
+
+def serve(output, port, args):
+    # keep the report readable, the server logs every request and dumps every configuration
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    os.dup2(devnull, 2)
+    reload_cmd = args.reload_cmd or f'sleep {args.reload_latency}'
+    s = RestServer(output, HOST, port, queue_depth=args.queue_depth,
+                   queue_deadline=args.queue_deadline, rate_limit=args.rate_limit,
+                   rate_burst=args.rate_burst, reload_cmd=reload_cmd)
+    s.serve()
+
+class SourceAddressAdapter(HTTPAdapter):
+    def __init__(self, source, **kwargs):
+        self.source = source
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['source_address'] = (self.source, 0)
+        super().init_poolmanager(*args, **kwargs)
+
+class RouteStats():
+    def __init__(self):
+        # latencies of successful requests only, fast rejections would hide slow ones
+        self.latencies = []
+        self.ok = 0
+        self.rejected = 0
+        self.errors = 0
+
+    def count(self):
+        return self.ok + self.rejected + self.errors
+
+    def merge(self, other):
+        self.latencies.extend(other.latencies)
+        self.ok += other.ok
+        self.rejected += other.rejected
+        self.errors += other.errors
+
+    def percentile(self, p):
+        if not self.latencies:
+            return 0.0
+        values = sorted(self.latencies)
+        return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+class Worker(threading.Thread):
+    def __init__(self, wid, base_uri, first_id, last_id, weights, deadline, timeout,
+                 retry_after=True, source=None):
+        super().__init__()
+        self.wid = wid
+        self.base_uri = base_uri
+        self.ids = list(range(first_id, last_id + 1))
+        self.weights = weights
+        self.deadline = deadline
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.session = requests.Session()
+        if source is not None:
+            self.session.mount('http://', SourceAddressAdapter(source))
+        self.rand = random.Random(wid)
+        self.stats = {op: RouteStats() for op in OPS}
+        # exports this worker owns, as it expects to find them in the configuration file
+        self.expected = {}
+        # exports whose outcome can't be known (e.g. request timed out)
+        self.unknown = set()
+        self.failures = []
+
+    def _payload(self, eid):
+        return {
+            'id': eid,
+            'name': f'/share-{eid}',
+            'fs': 'nfs',
+            'path': f'/volumes/share-{eid}',
+            'access': self.rand.choice(ACCESS),
+            'protocols': self.rand.choice(PROTOCOLS),
+            'clients': self.rand.choice(CLIENTS),
+        }
+
+    def _request(self, op, method, uri, payload=None):
+        stats = self.stats[op]
+        start = time.monotonic()
+        try:
+            r = self.session.request(method, uri, json=payload, timeout=self.timeout)
+        except requests.RequestException as e:
+            stats.errors += 1
+            self.failures.append(f'{op}: {e}')
+            return None
+        if r.status_code in [429, 503]:
+            stats.rejected += 1
+            self._backoff(r)
+        elif r.status_code < 400:
+            stats.latencies.append(time.monotonic() - start)
+            stats.ok += 1
+        else:
+            stats.errors += 1
+            self.failures.append(f'{op}: unexpected status {r.status_code}')
+        return r
+
+    def _backoff(self, r):
+        # behave like a well-mannered client instead of hammering a server which is shedding load
+        if not self.retry_after:
+            return
+        try:
+            delay = float(r.headers.get('Retry-After', 0))
+        except ValueError:
+            return
+        time.sleep(max(0, min(delay, self.deadline - time.monotonic())))
+
+    def _pick(self):
+        op = self.rand.choices(list(self.weights.keys()), list(self.weights.values()))[0]
+        owned = [eid for eid in self.expected if eid not in self.unknown]
+        free = [eid for eid in self.ids if eid not in self.expected and eid not in self.unknown]
+        if op in [OP_READ, OP_UPDATE, OP_DELETE] and not owned:
+            op = OP_CREATE
+        if op == OP_CREATE and not free:
+            op = OP_DELETE
+        if op == OP_DELETE and not owned:
+            # every export ID of ours has an unknown outcome, nothing left to mutate
+            op = OP_LIST
+        eid = self.rand.choice(free if op == OP_CREATE else owned) if op != OP_LIST else None
+        return op, eid
+
+    def _do_list(self, eid):
+        self._request(OP_LIST, 'GET', self.base_uri)
+
+    def _do_create(self, eid):
+        payload = self._payload(eid)
+        r = self._request(OP_CREATE, 'POST', self.base_uri, payload)
+        if r is None or r.status_code >= 500 and r.status_code != 503:
+            self.unknown.add(eid)
+        elif r.status_code == 200:
+            self.expected[eid] = state(NfsExport(payload))
+
+    def _do_read(self, eid):
+        r = self._request(OP_READ, 'GET', f'{self.base_uri}/{eid}')
+        if r is not None and r.status_code == 200 and eid not in self.unknown:
+            if state(NfsExport(r.json())) != self.expected[eid]:
+                self.stats[OP_READ].errors += 1
+                self.failures.append(f'{OP_READ}: stale export {eid}')
+
+    def _do_update(self, eid):
+        payload = self._payload(eid)
+        r = self._request(OP_UPDATE, 'PUT', f'{self.base_uri}/{eid}', payload)
+        if r is None or r.status_code >= 500 and r.status_code != 503:
+            self.unknown.add(eid)
+        elif r.status_code == 200:
+            name, fs, path, _, _, _ = self.expected[eid]
+            self.expected[eid] = (name, fs, path, payload['access'],
+                                  payload['protocols'], payload['clients'])
+
+    def _do_delete(self, eid):
+        r = self._request(OP_DELETE, 'DELETE', f'{self.base_uri}/{eid}')
+        if r is None or r.status_code >= 500 and r.status_code != 503:
+            self.unknown.add(eid)
+        elif r.status_code == 204:
+            del self.expected[eid]
+
+    def run(self):
+        handlers = {
+            OP_LIST: self._do_list,
+            OP_CREATE: self._do_create,
+            OP_READ: self._do_read,
+            OP_UPDATE: self._do_update,
+            OP_DELETE: self._do_delete,
+        }
+        while time.monotonic() < self.deadline:
+            op, eid = self._pick()
+            try:
+                handlers[op](eid)
+            except Exception as e:
+                # a malformed answer must show up in the report, not silently kill the worker
+                self.stats[op].errors += 1
+                self.failures.append(f'{op}: {type(e).__name__}: {e}')
+                if eid is not None:
+                    self.unknown.add(eid)
+
+def check(output, workers):
+    problems = []
+    cfg = GaneshaExportConfig(output)
+    try:
+        cfg.read()
+    except Exception as e:
+        return [f'unable to parse configuration file: {e}']
+
+    found = {}
+    for e in cfg.exports:
+        export = NfsExport(e)
+        if export.eid in found:
+            problems.append(f'duplicated export {export.eid}')
+        found[export.eid] = state(export)
+
+    expected = {}
+    unknown = set()
+    for w in workers:
+        expected.update(w.expected)
+        unknown |= w.unknown
+
+    for eid in sorted(set(expected) | set(found)):
+        if eid in unknown:
+            continue
+        if eid not in found:
+            problems.append(f'missing export {eid}')
+        elif eid not in expected:
+            problems.append(f'unexpected export {eid}')
+        elif found[eid] != expected[eid]:
+            problems.append(f'export {eid} is {found[eid]}, expected {expected[eid]}')
+    return problems
+
+def report(workers, elapsed):
+    total = RouteStats()
+    print(f'{"route":<28} {"count":>7} {"ok/s":>8} {"rej/s":>8} {"p50 ms":>8} {"p95 ms":>8} '
+          f'{"p99 ms":>8} {"rejected":>9} {"errors":>7}')
+    for op in OPS + ['total']:
+        stats = total
+        if op != 'total':
+            stats = RouteStats()
+            for w in workers:
+                stats.merge(w.stats[op])
+            total.merge(stats)
+        count = stats.count()
+        rejected = 100 * stats.rejected / count if count else 0
+        errors = 100 * stats.errors / count if count else 0
+        print(f'{op:<28} {count:>7} {stats.ok / elapsed:>8.1f} {stats.rejected / elapsed:>8.1f} '
+              f'{stats.percentile(50) * 1000:>8.1f} {stats.percentile(95) * 1000:>8.1f} '
+              f'{stats.percentile(99) * 1000:>8.1f} {rejected:>8.1f}% {errors:>6.1f}%')
+    return total
+
+def weights(s):
+    w = [float(x) for x in s.split(',')]
+    if len(w) != len(OPS) or sum(w) <= 0:
+        raise argparse.ArgumentTypeError(f'expected {len(OPS)} comma-separated weights')
+    return dict(zip(OPS, w))
+
+def wait_ready(server, uri, timeout=10):
+    # another process may own the port, only trust an export list answered while ours is alive
+    limit = time.monotonic() + timeout
+    while time.monotonic() < limit and server.is_alive():
+        try:
+            r = requests.get(uri, timeout=1)
+            if r.status_code == 200 and type(r.json()) == list:
+                return server.is_alive()
+        except (requests.RequestException, ValueError):
+            pass
+        time.sleep(0.1)
+    return False
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='NFS Ganesha Export API load-testing harness')
+    parser.add_argument('-c', '--concurrency', type=int, default=8,
+                        help='number of concurrent clients (default: 8)')
+    parser.add_argument('-t', '--duration', type=float, default=10,
+                        help='test duration in seconds (default: 10)')
+    parser.add_argument('-w', '--weights', type=weights, default='20,20,30,20,10',
+                        help='list,create,read,update,delete workload weights '
+                        '(default: 20,20,30,20,10)')
+    parser.add_argument('-p', '--port', type=int, default=PORT,
+                        help=f'local port to run the server on (default: {PORT})')
+    parser.add_argument('--reload-latency', type=float, default=0.05,
+                        help='artificial NFS Ganesha reload latency in seconds (default: 0.05)')
+    parser.add_argument('--reload-cmd', default=None,
+                        help='reload command stub, overrides --reload-latency')
+    parser.add_argument('--timeout', type=float, default=30,
+                        help='client request timeout in seconds (default: 30)')
+    parser.add_argument('--queue-depth', type=int, default=ADMISSION_QUEUE_DEPTH_DEFAULT_VALUE,
+                        help='mutation queue depth (default: %(default)s)')
+    parser.add_argument('--queue-deadline', type=float,
+                        default=ADMISSION_QUEUE_DEADLINE_DEFAULT_VALUE,
+                        help='mutation queue deadline in seconds (default: %(default)s)')
+    parser.add_argument('--rate-limit', type=float, default=ADMISSION_RATE_LIMIT_DEFAULT_VALUE,
+                        help='per-client mutation rate limit (default: %(default)s)')
+    parser.add_argument('--rate-burst', type=int, default=ADMISSION_RATE_BURST_DEFAULT_VALUE,
+                        help='per-client mutation burst (default: %(default)s)')
+    parser.add_argument('--ignore-retry-after', action='store_true', default=False,
+                        help='retry rejected requests right away instead of honouring Retry-After')
+    parser.add_argument('--distinct-sources', action='store_true', default=False,
+                        help='bind each client to its own loopback address (127.1.x.y, Linux '
+                        'only), otherwise clients share a single per-client rate limit')
+    parser.add_argument('--min-throughput', type=float, default=0,
+                        help='fail if overall goodput (successful req/s) is lower than this')
+    parser.add_argument('--max-error-rate', type=float, default=0,
+                        help='fail if overall error rate (%%) is higher than this (default: 0)')
+    args = parser.parse_args()
+
+    if args.concurrency < 1 or args.concurrency > 65535:
+        print(f'Invalid concurrency: {args.concurrency}')
+        sys.exit(1)
+    stride = 65535 // args.concurrency
+
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, 'export.conf')
+        open(output, 'w').close()
+
+        server = multiprocessing.Process(target=serve, args=(output, args.port, args), daemon=True)
+        server.start()
+        base_uri = f'http://{HOST}:{args.port}/api/v1/export'
+        if not wait_ready(server, base_uri):
+            server.terminate()
+            print(f'Unable to start server on port {args.port}')
+            sys.exit(1)
+
+        print(f'Running {args.concurrency} clients for {args.duration}s '
+              f'(reload: {args.reload_cmd or f"sleep {args.reload_latency}"}) ...')
+        deadline = time.monotonic() + args.duration
+        workers = []
+        for i in range(args.concurrency):
+            source = f'127.1.{(i >> 8) & 255}.{i & 255}' if args.distinct_sources else None
+            workers.append(Worker(i, base_uri, i * stride + 1, (i + 1) * stride, args.weights,
+                                  deadline, args.timeout, not args.ignore_retry_after, source))
+        start = time.monotonic()
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        elapsed = time.monotonic() - start
+
+        server.terminate()
+        server.join()
+
+        total = report(workers, elapsed)
+        problems = check(output, workers)
+
+    failures = [f for w in workers for f in w.failures]
+    for f in sorted(set(failures)):
+        print(f'error: {f} (x{failures.count(f)})')
+    for p in problems:
+        print(f'inconsistency: {p}')
+
+    count = total.count()
+    # rejected requests don't count, a server rejecting everything is not fast
+    throughput = total.ok / elapsed
+    error_rate = 100 * total.errors / count if count else 0
+    ok = True
+    if problems:
+        print(f'FAILED: {len(problems)} configuration inconsistencies')
+        ok = False
+    if error_rate > args.max_error_rate:
+        print(f'FAILED: error rate {error_rate:.1f}% is higher than {args.max_error_rate}%')
+        ok = False
+    if throughput < args.min_throughput:
+        print(f'FAILED: goodput {throughput:.1f} req/s is lower than {args.min_throughput}')
+        ok = False
+
+    sys.exit(0 if ok else 1)
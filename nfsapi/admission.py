@@ -0,0 +1,136 @@
+# Copyright (c) The Kowabunga Project
+# Apache License, Version 2.0 (see LICENSE or https://www.apache.org/licenses/LICENSE-2.0.txt)
+# SPDX-License-Identifier: Apache-2.0
+
+import math
+import time
+from contextlib import contextmanager
+from threading import Condition, Lock
+from typing import Dict, Optional
+
+from nfsapi.common import *
+
+class AdmissionError(Exception):
+    def __init__(self, status: int, retry_after: int):
+        super().__init__(f'request rejected with status {status}, retry after {retry_after}s')
+        self.status = status
+        self.retry_after = retry_after
+
+class TokenBucket():
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.stamp = time.monotonic()
+
+    def level(self, now: float) -> float:
+        return min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+
+    def refill(self, now: float):
+        self.tokens = self.level(now)
+        self.stamp = now
+
+    def is_full(self, now: float) -> bool:
+        return self.level(now) >= self.burst
+
+    def consume(self) -> float:
+        # returns 0 when a token has been taken, time to wait for the next one otherwise
+        self.refill(time.monotonic())
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+class RateLimiter():
+    def __init__(self, rate: float = ADMISSION_RATE_LIMIT_DEFAULT_VALUE,
+                 burst: int = ADMISSION_RATE_BURST_DEFAULT_VALUE):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.lock = Lock()
+
+    def _prune(self):
+        # drop clients whose bucket has been refilled, they would start from a full one anyway
+        now = time.monotonic()
+        for client in [c for c, b in self.buckets.items() if b.is_full(now)]:
+            del self.buckets[client]
+
+        # still too many clients, evict the least recently seen one
+        if len(self.buckets) >= ADMISSION_RATE_MAX_CLIENTS:
+            del self.buckets[min(self.buckets, key=lambda c: self.buckets[c].stamp)]
+
+    def consume(self, client: str):
+        if not self.rate:
+            return
+
+        with self.lock:
+            if client not in self.buckets and len(self.buckets) >= ADMISSION_RATE_MAX_CLIENTS:
+                self._prune()
+            bucket = self.buckets.setdefault(client, TokenBucket(self.rate, self.burst))
+            wait = bucket.consume()
+
+        if wait > 0:
+            raise AdmissionError(429, max(1, math.ceil(wait)))
+
+class MutationQueue():
+    def __init__(self, depth: int = ADMISSION_QUEUE_DEPTH_DEFAULT_VALUE,
+                 deadline: Optional[float] = ADMISSION_QUEUE_DEADLINE_DEFAULT_VALUE):
+        self.depth = max(1, depth)
+        self.deadline = deadline if deadline else None
+        self.pending = 0
+        self.latency: Optional[float] = None
+        # mutations are admitted in arrival order, each one waiting for its ticket to be served
+        self._next_ticket = 0
+        self._serving = 0
+        self._abandoned = set()
+        self._cond = Condition()
+
+    def record(self, elapsed: float):
+        # exponentially weighted moving average of the time spent writing the configuration
+        # and reloading the NFS service, mutations rejected before that don't count
+        with self._cond:
+            if self.latency is None:
+                self.latency = elapsed
+            else:
+                self.latency += ADMISSION_LATENCY_WEIGHT * (elapsed - self.latency)
+
+    def retry_after(self) -> int:
+        latency = self.latency if self.latency is not None else 1.0
+        return max(1, math.ceil(latency * max(1, self.pending)))
+
+    def _reject(self):
+        raise AdmissionError(503, self.retry_after())
+
+    @contextmanager
+    def admit(self):
+        with self._cond:
+            if self.pending >= self.depth:
+                self._reject()
+            # fast-fail when queued mutations are not expected to drain before our deadline
+            if self.deadline is not None and self.latency is not None and \
+               self.latency * self.pending > self.deadline:
+                self._reject()
+
+            self.pending += 1
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            expires = time.monotonic() + self.deadline if self.deadline is not None else None
+            while ticket != self._serving:
+                remaining = expires - time.monotonic() if expires is not None else None
+                if remaining is not None and remaining <= 0:
+                    # let the queue skip over our ticket when it gets served
+                    self._abandoned.add(ticket)
+                    self.pending -= 1
+                    self._reject()
+                self._cond.wait(remaining)
+
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.pending -= 1
+                self._serving += 1
+                while self._serving in self._abandoned:
+                    self._abandoned.remove(self._serving)
+                    self._serving += 1
+                self._cond.notify_all()
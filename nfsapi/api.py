@@ -4,15 +4,20 @@
 
 import os
 import json
+import time
+import functools
 from bottle import Bottle
 from bottle import request, response
 from bottle import post, get, put, delete
 from bottle import route, run
 from threading import Lock
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIServer
 
 from nfsapi.common import *
 from nfsapi.parser import RawBlock
 from nfsapi.exports import GaneshaExportConfig
+from nfsapi.admission import AdmissionError, MutationQueue, RateLimiter
 
 EXPORT_API_KEY_ID = 'id'
 EXPORT_API_KEY_NAME = 'name'
@@ -116,55 +121,93 @@ class NfsExport():
         }
         return RawBlock(NFS_BLOCK_EXPORT, [fsal, client], export_values)
 
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+    request_queue_size = HTTP_LISTEN_BACKLOG
+
 class RestServer(Bottle):
-    def __init__(self, output, host='0.0.0.0', port=54934, debug=False, reload=False):
+    def __init__(self, output, host='0.0.0.0', port=54934, debug=False, reload=False,
+                 queue_depth=ADMISSION_QUEUE_DEPTH_DEFAULT_VALUE,
+                 queue_deadline=ADMISSION_QUEUE_DEADLINE_DEFAULT_VALUE,
+                 rate_limit=ADMISSION_RATE_LIMIT_DEFAULT_VALUE,
+                 rate_burst=ADMISSION_RATE_BURST_DEFAULT_VALUE,
+                 reload_cmd=NFS_RELOAD_CMD_DEFAULT_VALUE):
         self.output = output
         self.host = host
         self.port = port
         self.debug = debug
         self.reload = reload
+        self.reload_cmd = reload_cmd
         self._app = Bottle()
         self.cfg = GaneshaExportConfig(self.output)
         self.lock = Lock()
+        self.queue = MutationQueue(queue_depth, queue_deadline)
+        self.limiter = RateLimiter(rate_limit, rate_burst)
         self._route()
 
     def serve(self):
-        self._app.run(host=self.host, port=self.port, debug=self.debug, reloader=self.reload)
+        self._app.run(host=self.host, port=self.port, debug=self.debug, reloader=self.reload,
+                      server_class=ThreadingWSGIServer)
 
     def _prepare_headers(self):
         response.headers['Content-Type'] = 'application/json'
         response.headers['Cache-Control'] = 'no-cache'
 
     def _read(self):
-        self.lock.acquire()
-        self.cfg.read()
-        self.lock.release()
+        with self.lock:
+            self.cfg.read()
+
+    def _load(self):
+        # readers work on their own copy so that they never wait behind queued mutations
+        cfg = GaneshaExportConfig(self.output)
+        with self.lock:
+            cfg.read()
+        return cfg
 
     def _write(self):
-        self.lock.acquire()
-        data = self.cfg.dump()
-        self.cfg.write(data)
-        self.lock.release()
+        start = time.monotonic()
+        with self.lock:
+            data = self.cfg.dump()
+            self.cfg.write(data)
         self._reload()
+        self.queue.record(time.monotonic() - start)
 
     def _reload(self):
         try:
-            os.system("/usr/bin/systemctl reload nfs-ganesha.service")
+            os.system(self.reload_cmd)
         except:
             print("Unable to reload NFS Ganesha service")
 
+    def _mutation(self, callback):
+        # mutations are rate-limited per client and serialized through a bounded queue,
+        # rejected ones are told when to come back
+        @functools.wraps(callback)
+        def wrapper(*args, **kwargs):
+            try:
+                self.limiter.consume(request.environ.get('REMOTE_ADDR', ''))
+                with self.queue.admit():
+                    return callback(*args, **kwargs)
+            except AdmissionError as e:
+                response.status = e.status
+                response.headers['Retry-After'] = str(e.retry_after)
+                return
+        return wrapper
+
     def _route(self):
         self._app.route('/api/v1/export', method="GET", callback=self._list_exports)
-        self._app.route('/api/v1/export', method="POST", callback=self._create_export)
+        self._app.route('/api/v1/export', method="POST",
+                        callback=self._mutation(self._create_export))
         self._app.route('/api/v1/export/<eid:int>', method="GET", callback=self._read_export)
-        self._app.route('/api/v1/export/<eid:int>', method="PUT", callback=self._update_export)
-        self._app.route('/api/v1/export/<eid:int>', method="DELETE", callback=self._delete_export)
+        self._app.route('/api/v1/export/<eid:int>', method="PUT",
+                        callback=self._mutation(self._update_export))
+        self._app.route('/api/v1/export/<eid:int>', method="DELETE",
+                        callback=self._mutation(self._delete_export))
 
     def _list_exports(self):
-        self._read()
+        cfg = self._load()
 
         ids = []
-        for e in self.cfg.exports:
+        for e in cfg.exports:
             ids.append(e.values[NFS_EXPORT_ATTR_ID])
 
         self._prepare_headers()
@@ -192,9 +235,9 @@ class RestServer(Bottle):
         return export.json()
 
     def _read_export(self, eid):
-        self._read()
+        cfg = self._load()
 
-        e = self.cfg.lookup_by_id(eid)
+        e = cfg.lookup_by_id(eid)
         if e is None:
             response.status = 404
             return
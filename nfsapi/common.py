@@ -6,6 +6,10 @@ APP_DESCRIPTION = '''
 NFS Ganesha Export REST API Server
 '''
 
+HTTP_LISTEN_BACKLOG = 128
+
+NFS_RELOAD_CMD_DEFAULT_VALUE = '/usr/bin/systemctl reload nfs-ganesha.service'
+
 NFS_BLOCK_EXPORT = 'EXPORT'
 NFS_EXPORT_ATTR_ID = 'Export_id'
 NFS_EXPORT_ATTR_PATH = 'Path'
@@ -31,3 +35,11 @@ NFS_FSAL_ATTR_FS = 'Filesystem'
 NFS_FSAL_ATTR_FS_DEFAULT_VALUE = 'nfs'
 NFS_BLOCK_CLIENT = 'CLIENT'
 NFS_CLIENT_ATTR_CLIENTS = 'Clients'
+
+ADMISSION_CONFIG_KEYS = ['queue_depth', 'queue_deadline', 'rate_limit', 'rate_burst']
+ADMISSION_QUEUE_DEPTH_DEFAULT_VALUE = 16
+ADMISSION_QUEUE_DEADLINE_DEFAULT_VALUE = 30
+ADMISSION_RATE_LIMIT_DEFAULT_VALUE = 0
+ADMISSION_RATE_BURST_DEFAULT_VALUE = 10
+ADMISSION_RATE_MAX_CLIENTS = 1024
+ADMISSION_LATENCY_WEIGHT = 0.2
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# Copyright (c) The Kowabunga Project
+# Apache License, Version 2.0 (see LICENSE or https://www.apache.org/licenses/LICENSE-2.0.txt)
+# SPDX-License-Identifier: Apache-2.0
+
+import threading
+import time
+import unittest
+from unittest import mock
+
+from nfsapi.admission import AdmissionError, MutationQueue, RateLimiter
+
+class MutationQueueTest(unittest.TestCase):
+    def _hold(self, queue):
+        # keeps the queue busy from another thread until released
+        admitted = threading.Event()
+        release = threading.Event()
+
+        def run():
+            with queue.admit():
+                admitted.set()
+                release.wait()
+
+        t = threading.Thread(target=run)
+        t.start()
+        admitted.wait()
+        return t, release
+
+    def test_reject_when_depth_is_reached(self):
+        q = MutationQueue(depth=1, deadline=1)
+        t, release = self._hold(q)
+        with self.assertRaises(AdmissionError) as ctx:
+            with q.admit():
+                pass
+        release.set()
+        t.join()
+        self.assertEqual(ctx.exception.status, 503)
+        self.assertEqual(q.pending, 0)
+
+    def test_reject_when_deadline_expires(self):
+        q = MutationQueue(depth=2, deadline=0.1)
+        t, release = self._hold(q)
+        start = time.monotonic()
+        with self.assertRaises(AdmissionError) as ctx:
+            with q.admit():
+                pass
+        self.assertGreaterEqual(time.monotonic() - start, 0.1)
+        self.assertEqual(ctx.exception.status, 503)
+        self.assertEqual(q.pending, 1)
+        release.set()
+        t.join()
+        self.assertEqual(q.pending, 0)
+
+    def test_reject_when_queue_would_not_drain_before_deadline(self):
+        q = MutationQueue(depth=4, deadline=1)
+        q.record(2)
+        t, release = self._hold(q)
+        with self.assertRaises(AdmissionError) as ctx:
+            with q.admit():
+                pass
+        release.set()
+        t.join()
+        self.assertEqual(ctx.exception.status, 503)
+        self.assertEqual(ctx.exception.retry_after, 2)
+
+    def test_no_deadline_waits_forever(self):
+        q = MutationQueue(depth=2, deadline=0)
+        t, release = self._hold(q)
+        admitted = threading.Event()
+
+        def run():
+            with q.admit():
+                admitted.set()
+
+        waiter = threading.Thread(target=run)
+        waiter.start()
+        self.assertFalse(admitted.wait(0.2))
+        self.assertEqual(q.pending, 2)
+        release.set()
+        t.join()
+        waiter.join()
+        self.assertTrue(admitted.is_set())
+        self.assertEqual(q.pending, 0)
+
+    def test_admit_in_arrival_order(self):
+        q = MutationQueue(depth=4, deadline=0.5)
+        t, release = self._hold(q)
+        admitted = threading.Event()
+
+        def wait():
+            with q.admit():
+                admitted.set()
+
+        waiter = threading.Thread(target=wait)
+        waiter.start()
+        while q.pending < 2:
+            time.sleep(0.01)
+
+        # a greedy client re-entering the queue must not starve the older waiter
+        release.set()
+        t.join()
+        limit = time.monotonic() + 1
+        while not admitted.is_set() and time.monotonic() < limit:
+            try:
+                with q.admit():
+                    time.sleep(0.01)
+            except AdmissionError:
+                pass
+        waiter.join()
+        self.assertTrue(admitted.is_set())
+
+    def test_skip_abandoned_tickets(self):
+        q = MutationQueue(depth=4, deadline=0.1)
+        t, release = self._hold(q)
+        with self.assertRaises(AdmissionError):
+            with q.admit():
+                pass
+        release.set()
+        t.join()
+        start = time.monotonic()
+        with q.admit():
+            pass
+        self.assertLess(time.monotonic() - start, 0.1)
+        self.assertEqual(q.pending, 0)
+
+class RateLimiterTest(unittest.TestCase):
+    def test_reject_when_bucket_is_empty(self):
+        limiter = RateLimiter(rate=0.5, burst=1)
+        limiter.consume('10.0.0.1')
+        with self.assertRaises(AdmissionError) as ctx:
+            limiter.consume('10.0.0.1')
+        self.assertEqual(ctx.exception.status, 429)
+        self.assertEqual(ctx.exception.retry_after, 2)
+        # other clients have their own bucket
+        limiter.consume('10.0.0.2')
+
+    def test_disabled(self):
+        limiter = RateLimiter(rate=0, burst=1)
+        for i in range(10):
+            limiter.consume('10.0.0.1')
+        self.assertEqual(len(limiter.buckets), 0)
+
+    @mock.patch('nfsapi.admission.ADMISSION_RATE_MAX_CLIENTS', 4)
+    def test_prune_refilled_clients(self):
+        limiter = RateLimiter(rate=1, burst=1)
+        for i in range(4):
+            limiter.consume(f'10.0.0.{i}')
+        # make the first two clients look idle for long enough to be refilled
+        for i in range(2):
+            limiter.buckets[f'10.0.0.{i}'].stamp -= 10
+        limiter.consume('10.0.0.4')
+        self.assertEqual(sorted(limiter.buckets), ['10.0.0.2', '10.0.0.3', '10.0.0.4'])
+
+    @mock.patch('nfsapi.admission.ADMISSION_RATE_MAX_CLIENTS', 4)
+    def test_evict_least_recent_client(self):
+        limiter = RateLimiter(rate=1, burst=1)
+        for i in range(4):
+            limiter.consume(f'10.0.0.{i}')
+        limiter.buckets['10.0.0.2'].stamp -= 0.5
+        limiter.consume('10.0.0.4')
+        self.assertEqual(len(limiter.buckets), 4)
+        self.assertNotIn('10.0.0.2', limiter.buckets)
+
+if __name__ == "__main__":
+    unittest.main()
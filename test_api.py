@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# Copyright (c) The Kowabunga Project
+# Apache License, Version 2.0 (see LICENSE or https://www.apache.org/licenses/LICENSE-2.0.txt)
+# SPDX-License-Identifier: Apache-2.0
+
+import io
+import json
+import os
+import tempfile
+import threading
+import unittest
+from contextlib import redirect_stdout
+from wsgiref.util import setup_testing_defaults
+
+from nfsapi.api import RestServer
+
+EXPORT = {
+    'id': 1,
+    'name': '/share-1',
+    'fs': 'nfs',
+    'path': '/volumes/share-1',
+    'access': 'RW',
+    'protocols': [4],
+    'clients': ['10.0.0.0/8'],
+}
+
+class RestServerAdmissionTest(unittest.TestCase):
+    def setUp(self):
+        fd, self.output = tempfile.mkstemp(suffix='.conf')
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.output)
+
+    def _server(self, **kwargs):
+        return RestServer(self.output, reload_cmd='true', **kwargs)
+
+    def _call(self, s, method, path, body=None, client='10.0.0.1'):
+        data = json.dumps(body).encode() if body is not None else b''
+        environ = {}
+        setup_testing_defaults(environ)
+        environ.update({
+            'REQUEST_METHOD': method,
+            'PATH_INFO': path,
+            'REMOTE_ADDR': client,
+            'CONTENT_TYPE': 'application/json',
+            'CONTENT_LENGTH': str(len(data)),
+            'wsgi.input': io.BytesIO(data),
+        })
+        res = {}
+
+        def start_response(status, headers, exc_info=None):
+            res['status'] = int(status.split()[0])
+            res['headers'] = dict(headers)
+
+        # the server dumps every configuration it writes
+        with redirect_stdout(io.StringIO()):
+            body = b''.join(s._app(environ, start_response))
+        return res['status'], res['headers'], body
+
+    def _hold(self, s):
+        # keeps a mutation in flight from another thread until released
+        admitted = threading.Event()
+        release = threading.Event()
+
+        def run():
+            with s.queue.admit():
+                admitted.set()
+                release.wait()
+
+        t = threading.Thread(target=run)
+        t.start()
+        admitted.wait()
+        return t, release
+
+    def test_saturated_queue(self):
+        s = self._server(queue_depth=1, queue_deadline=1)
+        t, release = self._hold(s)
+        try:
+            status, headers, _ = self._call(s, 'POST', '/api/v1/export', EXPORT)
+            self.assertEqual(status, 503)
+            self.assertGreaterEqual(int(headers['Retry-After']), 1)
+
+            # reads bypass the mutation queue
+            status, _, body = self._call(s, 'GET', '/api/v1/export')
+            self.assertEqual(status, 200)
+            self.assertEqual(json.loads(body), [])
+        finally:
+            release.set()
+            t.join()
+
+        status, _, _ = self._call(s, 'POST', '/api/v1/export', EXPORT)
+        self.assertEqual(status, 200)
+
+    def test_rate_limit(self):
+        s = self._server(rate_limit=0.5, rate_burst=1)
+        status, _, _ = self._call(s, 'POST', '/api/v1/export', EXPORT)
+        self.assertEqual(status, 200)
+        status, headers, _ = self._call(s, 'DELETE', '/api/v1/export/1')
+        self.assertEqual(status, 429)
+        self.assertEqual(headers['Retry-After'], '2')
+
+        # other clients have their own bucket
+        status, _, _ = self._call(s, 'DELETE', '/api/v1/export/1', client='10.0.0.2')
+        self.assertEqual(status, 204)
+
+    def test_only_writes_record_latency(self):
+        s = self._server()
+        status, _, _ = self._call(s, 'PUT', '/api/v1/export/1', EXPORT)
+        self.assertEqual(status, 404)
+        self.assertIsNone(s.queue.latency)
+
+        status, _, _ = self._call(s, 'POST', '/api/v1/export', EXPORT)
+        self.assertEqual(status, 200)
+        self.assertIsNotNone(s.queue.latency)
+
+if __name__ == "__main__":
+    unittest.main()